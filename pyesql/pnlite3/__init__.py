@@ -1,3 +1,3 @@
-from . import database, lite3, enums
+from . import database, lite3, enums, profiler
 
-__all__ = ["database", "lite3", "enums"]
+__all__ = ["database", "lite3", "enums", "profiler"]
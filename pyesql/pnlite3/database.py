@@ -1,15 +1,20 @@
 import contextlib
 import sqlite3
+import time
 from datetime import datetime
 from sqlite3 import Error
 from typing import List, Union
 
 from .enums import BaseMethod, DBObj, Mark, Method, Order
 from .lite3 import SQLite3Table
+from ..profiler import QueryProfiler, condition_columns, source_table, table_aliases
+from .profiler import parse_explain
+from ..watch import Checkpoint
 
 
 class Database:
-    def __init__(self, file_path, in_memory=False) -> None:
+    def __init__(self, file_path, in_memory=False, profiler: QueryProfiler = None) -> None:
+        self.profiler = profiler
         self._database_name = file_path
         if not file_path or in_memory:
             self._database_name = ':memory:'
@@ -33,21 +38,68 @@ class Database:
             return " ".join(sql) + ";"
         return " ".join(sql)
     
-    def _execute(self, sql, fetchall=False, fetchone=False,nocommit=False):
+    def _execute(self, sql, fetchall=False, fetchone=False,nocommit=False, profile=True):
         try:
             with contextlib.closing(sqlite3.connect(self.database_name)) as conn:
                 cursor = conn.cursor()
+                start = time.perf_counter()
                 cursor.execute(sql)
                 if nocommit:
-                    return
-                if fetchall:
-                    return cursor.fetchall()
-                if fetchone:
-                    return cursor.fetchone()
-                return conn.commit()
+                    res = None
+                elif fetchall:
+                    res = cursor.fetchall()
+                elif fetchone:
+                    res = cursor.fetchone()
+                else:
+                    res = conn.commit()
+                elapsed = time.perf_counter() - start
         except Error as e:
             print (e,f"\nSQL: {sql}") 
-            
+            return
+        if profile and self.profiler is not None:
+            self._profile(sql, elapsed)
+        return res
+
+    def _profile(self, sql, elapsed):
+        self.profiler.record_call(sql, elapsed)
+        if not self.profiler.should_profile(sql, elapsed):
+            return
+        # Profiling is best effort, the caller's statement already succeeded
+        try:
+            self._explain(sql)
+        except Exception as e:
+            self.profiler.record_error(sql, e)
+
+    def _explain(self, sql):
+        explain_sql = self._to_sql_string([BaseMethod.EXPLAIN, "QUERY PLAN", sql.rstrip().rstrip(";")])
+        table = source_table(sql)
+        table_rows = {}
+        columns, indexed_columns = [], []
+        with contextlib.closing(sqlite3.connect(self.database_name)) as conn:
+            cursor = conn.cursor()
+            plan = parse_explain(cursor.execute(explain_sql).fetchall())
+            # Row estimates only exist once ANALYZE has created sqlite_stat1, without them the check is skipped
+            has_stat = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1';").fetchone()
+            if has_stat:
+                # The plan names a table by its alias when the query gives one
+                aliases = table_aliases(sql)
+                for relation in {node.relation for node in plan.walk() if node.is_full_scan and node.relation}:
+                    stat = cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1;",
+                                          (aliases.get(relation, relation),)).fetchone()
+                    if stat and stat[0]:
+                        table_rows[relation] = int(stat[0].split(" ")[0])
+            if table:
+                columns = condition_columns(sql)
+                for column in cursor.execute(f'PRAGMA table_info("{table}");').fetchall():
+                    if column[5] == 1:
+                        indexed_columns.append(column[1])
+                for index in cursor.execute(f'PRAGMA index_list("{table}");').fetchall():
+                    index_info = cursor.execute(f'PRAGMA index_info("{index[1]}");').fetchall()
+                    indexed_columns += [info[2] for info in index_info if info[0] == 0]
+        findings = self.profiler.analyze(plan, columns, table_rows, indexed_columns)
+        self.profiler.record_plan(sql, plan, findings)
+
     def _execute_value(self, sql, values, fetchall=False):
         try:
             with contextlib.closing(sqlite3.connect(self.database_name)) as conn:
@@ -225,6 +277,44 @@ class Database:
     def custom_SQL(self,sql_string,fetchall=True,fetchone=False):
         return self._execute(sql_string,fetchall=fetchall,fetchone=fetchone)
 
+    def _watch_batch(self, table: str, watermark_column: str, items: Union[str, list, tuple], watermark, batch_size: int):
+        if isinstance(items, list) or isinstance(items, tuple):
+            items = ','.join(items)
+        conditions = None
+        if watermark is not None:
+            conditions = [Method.WHERE, watermark_column, ">", f"'{watermark}'"]
+        # The watermark column is selected first so the next batch can start after the last row
+        sql = self._select_items_condition_sql(table, f"{watermark_column},{items}", conditions)
+        sql.extend([Method.ORDER, Method.BY, watermark_column, Order.ASC, Method.LIMIT, f"{batch_size}"])
+        sql = self._to_sql_string(sql)
+        # Polling queries are not profiled, they would be sampled and explained on every round
+        rows = self._execute(sql, fetchall=True, profile=False)
+        if rows is None:
+            # _execute only reports SQL errors, a watcher must not mistake them for an idle table
+            raise Error(f"Watch query failed, SQL: {sql}")
+        return rows
+
+    def watch(self, table: str, watermark_column: str, items: Union[str, list, tuple] = '*', watermark=None,
+              checkpoint: Checkpoint = None, batch_size: int = 500, poll_interval: float = 1.0,
+              stop_when_idle: bool = False):
+        # 'watermark_column' must be unique and increasing (e.g. an INTEGER PRIMARY KEY) and
+        # should be indexed so every batch is a range scan. SQLite serializes writers, so rows
+        # cannot commit behind an already read watermark as they can on PostgreSQL.
+        if watermark is None and checkpoint is not None:
+            watermark = checkpoint.load()
+        while True:
+            batch = self._watch_batch(table, watermark_column, items, watermark, batch_size)
+            for row in batch:
+                yield row[1:]
+            if batch:
+                watermark = batch[-1][0]
+                if checkpoint is not None:
+                    checkpoint.save(watermark)
+            if len(batch) < batch_size:
+                if stop_when_idle:
+                    return
+                time.sleep(poll_interval)
+
 if __name__ == "__main__":
     # Create Database
     db = Database('camera_result.db')
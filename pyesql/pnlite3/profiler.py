@@ -0,0 +1,59 @@
+import re
+from typing import List
+
+_RELATION_PATTERN = re.compile(r"^(SCAN|SEARCH)\s+(?:TABLE\s+)?(\w+)")
+_INDEX_PATTERN = re.compile(r"USING\s+(?:COVERING\s+)?INDEX\s+(\w+)")
+
+
+class PlanNode:
+    node_type: str
+    detail: str
+    relation: str
+    index_name: str
+    children: List["PlanNode"]
+
+    def __init__(self, node_type: str, detail: str = None, relation: str = None, index_name: str = None,
+                 children: List["PlanNode"] = None) -> None:
+        self.node_type = node_type
+        self.detail = detail
+        self.relation = relation
+        self.index_name = index_name
+        self.children = children if children else []
+
+    @classmethod
+    def from_detail(cls, detail: str):
+        relation = _RELATION_PATTERN.match(detail)
+        index_name = _INDEX_PATTERN.search(detail)
+        return cls(node_type=detail.split(" ")[0],
+                   detail=detail,
+                   relation=relation.group(2) if relation else None,
+                   index_name=index_name.group(1) if index_name else None)
+
+    @property
+    def is_full_scan(self) -> bool:
+        # "SCAN t USING INDEX ..." walks an index, only a bare SCAN reads the whole table
+        return self.node_type == "SCAN" and "USING" not in self.detail
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self) -> dict:
+        return {"node_type": self.node_type,
+                "detail": self.detail,
+                "relation": self.relation,
+                "index_name": self.index_name,
+                "children": [child.to_dict() for child in self.children]}
+
+
+def parse_explain(rows: list) -> PlanNode:
+    # EXPLAIN QUERY PLAN rows are (id, parent, notused, detail), parent 0 is the root
+    root = PlanNode("QUERY PLAN")
+    nodes = {0: root}
+    for node_id, parent, _, detail in rows:
+        node = PlanNode.from_detail(detail)
+        nodes.get(parent, root).children.append(node)
+        nodes[node_id] = node
+    return root
+
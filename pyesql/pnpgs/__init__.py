@@ -1,3 +1,3 @@
-from . import database, postgre, enums
+from . import database, postgre, enums, policy, profiler
 
-__all__ = ["database", "postgre", "enums"]
+__all__ = ["database", "postgre", "enums", "policy", "profiler"]
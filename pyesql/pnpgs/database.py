@@ -1,6 +1,12 @@
-from datetime import datetime
+import select
+import time
+from datetime import datetime, timedelta
 from .enums import *
 from .postgre import PostgreTable
+from .policy import CircuitBreaker, RetryPolicy, is_transient
+from ..profiler import QueryProfiler, condition_columns, source_table
+from .profiler import parse_explain
+from ..watch import Checkpoint
 try:
     import psycopg
     from psycopg import OperationalError
@@ -11,7 +17,14 @@ from typing import Union
 
 class Database:
     def __init__(self, database=None, username=None, password=None, host=None,
-                 create_db_if_notexists: bool = True) -> None:
+                 create_db_if_notexists: bool = True, profiler: QueryProfiler = None,
+                 connect_timeout: int = 3, statement_timeout: float = None,
+                 retry_policy: RetryPolicy = None, circuit_breaker: CircuitBreaker = None) -> None:
+        self.profiler = profiler
+        self.connect_timeout = connect_timeout
+        self.statement_timeout = statement_timeout
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
         self.connect_string_list = []
         if host:
             _host_string = f"host={host}"
@@ -48,20 +61,145 @@ class Database:
         connect_str_with_db.append(_database_string)
         self.connect_str = ' '.join(connect_str_with_db)
 
-    def _execute(self, sql, fetchall=False, autocommit=False, conn_str=None, timeout=3):
-        conn = psycopg.connect(self.connect_str if conn_str == None else conn_str, connect_timeout=timeout)
-        if autocommit:
-            conn.autocommit = True
-        cursor = conn.cursor()
-        cursor.execute(sql)
-        if fetchall:
-            res = cursor.fetchall()
-        else:
-            res = conn.commit()
-        cursor.close()
-        conn.close()
+    def _connect_timeout(self, timeout=None):
+        timeout = self.connect_timeout if timeout == None else timeout
+        # libpq only accepts whole seconds
+        if isinstance(timeout, bool) or not isinstance(timeout, int) or timeout < 0:
+            raise ValueError(f"'connect_timeout' must be a non negative integer of seconds, but got {timeout}")
+        return timeout
+
+    def _connect(self, conn_str=None, timeout=None, statement_timeout=None):
+        kwargs = {"connect_timeout": self._connect_timeout(timeout)}
+        if statement_timeout == None:
+            statement_timeout = self.statement_timeout
+        if statement_timeout:
+            kwargs["options"] = f"-c statement_timeout={int(statement_timeout * 1000)}"
+        try:
+            return psycopg.connect(self.connect_str if conn_str == None else conn_str, **kwargs)
+        except OperationalError as e:
+            # Permanent failures such as bad credentials keep their original error and SQLSTATE
+            if not is_transient(e):
+                raise
+            raise ConnectionError(f"Unable to connect to database: {e}") from e
+
+    def _execute_once(self, sql, fetchall=False, autocommit=False, conn_str=None, timeout=None, statement_timeout=None):
+        conn = self._connect(conn_str, timeout, statement_timeout)
+        try:
+            if autocommit:
+                conn.autocommit = True
+            cursor = conn.cursor()
+            start = time.perf_counter()
+            cursor.execute(sql)
+            if fetchall:
+                res = cursor.fetchall()
+            else:
+                res = conn.commit()
+            elapsed = time.perf_counter() - start
+            cursor.close()
+        finally:
+            conn.close()
+        return res, elapsed
+
+    def _execute(self, sql, fetchall=False, autocommit=False, conn_str=None, timeout=None, statement_timeout=None,
+                 idempotent=False, profile=True):
+        # Invalid arguments are rejected before the breaker, they say nothing about the server
+        timeout = self._connect_timeout(timeout)
+        attempts = self.retry_policy.max_attempts if self.retry_policy else 1
+        last_error = None
+        for attempt in range(attempts):
+            if self.circuit_breaker is not None:
+                rejected = None
+                try:
+                    self.circuit_breaker.before_call()
+                except ConnectionError as e:
+                    rejected = e
+                if rejected is not None:
+                    # When this call's own failures tripped the breaker, report what actually went wrong
+                    raise rejected if last_error is None else last_error
+            try:
+                res, elapsed = self._execute_once(sql, fetchall, autocommit, conn_str, timeout, statement_timeout)
+            except (ConnectionError, OperationalError) as e:
+                if not is_transient(e):
+                    self._record_call_result(success=True)
+                    raise
+                self._record_call_result(success=False)
+                last_error = e
+                # A failed connect never reached the server, so only then is a non idempotent statement safe to resend
+                if attempt + 1 >= attempts or not (idempotent or isinstance(e, ConnectionError)):
+                    raise
+                time.sleep(self.retry_policy.delay(attempt))
+                continue
+            except Exception:
+                self._record_call_result(success=True)
+                raise
+            except BaseException:
+                # Interrupted (KeyboardInterrupt, green thread timeouts) before the server answered
+                self._release_trial()
+                raise
+            self._record_call_result(success=True)
+            break
+        if profile and self.profiler is not None:
+            self._profile(sql, elapsed, conn_str, statement_timeout)
         return res
 
+    def _record_call_result(self, success):
+        if self.circuit_breaker is None:
+            return
+        if success:
+            self.circuit_breaker.record_success()
+        else:
+            self.circuit_breaker.record_failure()
+
+    def _release_trial(self):
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.release_trial()
+
+    def _profile(self, sql, elapsed, conn_str=None, statement_timeout=None):
+        self.profiler.record_call(sql, elapsed)
+        if not self.profiler.should_profile(sql, elapsed):
+            return
+        if self.circuit_breaker is not None and self.circuit_breaker.state != CircuitBreaker.CLOSED:
+            return
+        # Profiling is best effort, the caller's statement already succeeded
+        try:
+            self._explain(sql, conn_str, statement_timeout)
+        except Exception as e:
+            self.profiler.record_error(sql, e)
+
+    def _explain(self, sql, conn_str=None, statement_timeout=None):
+        options = "(ANALYZE, BUFFERS, FORMAT JSON)" if self.profiler.explain_analyze else "(FORMAT JSON)"
+        explain_sql = self._to_sql_string([BaseMethod.EXPLAIN, options, sql.rstrip().rstrip(";")])
+        table = source_table(sql)
+        conn = self._connect(conn_str, statement_timeout=statement_timeout)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(explain_sql)
+            plan = parse_explain(cursor.fetchall())
+            relations = {node.relation for node in plan.walk() if node.relation}
+            if table:
+                relations.add(table.split('.')[-1])
+            catalog = []
+            if relations:
+                # Row estimates and the leading column of every index, only that column can serve a plain condition
+                relnames = ",".join(f"'{relation}'" for relation in relations)
+                cursor.execute("SELECT c.relname, c.reltuples, a.attname FROM pg_class c "
+                               "LEFT JOIN pg_index i ON i.indrelid = c.oid "
+                               "LEFT JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = i.indkey[0] "
+                               f"WHERE c.relname IN ({relnames});")
+                catalog = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        # reltuples is -1 for a table that was never vacuumed or analyzed
+        table_rows = {relname: reltuples for relname, reltuples, _ in catalog if reltuples >= 0}
+        columns, indexed_columns = [], []
+        if table:
+            columns = condition_columns(sql)
+            indexed_columns = [attname for relname, _, attname in catalog
+                               if relname == table.split('.')[-1] and attname]
+        findings = self.profiler.analyze(plan, columns, table_rows, indexed_columns)
+        self.profiler.record_plan(sql, plan, findings)
+
     def _to_sql_string(self, sql_list: list, end=True) -> str:
         sql = []
         for sql_item in sql_list:
@@ -144,7 +282,7 @@ class Database:
         sql.append(db_name)
         return self._execute(self._to_sql_string(sql), autocommit=True, conn_str=conn_str)
 
-    def _update_item(self, table, update_item: list, update_value: list, conditions: dict = None, base_method: BaseMethod = BaseMethod.UPDATE):
+    def _update_item(self, table, update_item: list, update_value: list, conditions: dict = None, base_method: BaseMethod = BaseMethod.UPDATE, statement_timeout=None):
         sql = [base_method, table, Method.SET]
         update_str = self._itemsvalue_string(update_item, update_value)
         sql.extend(update_str)
@@ -152,15 +290,15 @@ class Database:
             condition_sql = self._condition_string(
                 conditions, return_values=False)
             sql.extend(condition_sql)
-            self._execute(self._to_sql_string(sql))
+            self._execute(self._to_sql_string(sql), statement_timeout=statement_timeout)
 
-    def _delete_item_condition(self, table, conditions: dict, base_method: BaseMethod = BaseMethod.DELETE):
+    def _delete_item_condition(self, table, conditions: dict, base_method: BaseMethod = BaseMethod.DELETE, statement_timeout=None):
         if isinstance(conditions, dict) and len(conditions) > 0:
             sql = [base_method, Method.FROM, table]
             condition_sql = self._condition_string(
                 conditions, return_values=False)
             sql.extend(condition_sql)
-            self._execute(self._to_sql_string(sql))
+            self._execute(self._to_sql_string(sql), statement_timeout=statement_timeout)
         else:
             raise ValueError(
                 "'conditions' value must be condition dict and at least one condition")
@@ -213,29 +351,29 @@ class Database:
         sql.append(table_name)
         return self._execute(self._to_sql_string(sql))
 
-    def select_items(self, table: str, items: Union[str, list, tuple], conditions: dict = None, order_by: str = None, order: Order = Order.DESC, conn_str=None):
+    def select_items(self, table: str, items: Union[str, list, tuple], conditions: dict = None, order_by: str = None, order: Order = Order.DESC, conn_str=None, statement_timeout=None):
         sql = self._select_items_condition_sql(table, items, conditions)
         if order_by:
             sql.extend([Method.ORDER, Method.BY, order_by, order.name])
-        return self._execute(self._to_sql_string(sql), fetchall=True, conn_str=conn_str)
+        return self._execute(self._to_sql_string(sql), fetchall=True, conn_str=conn_str, statement_timeout=statement_timeout, idempotent=True)
 
-    def select_counts_in_time(self, table: str, items, count_name, time_name, date_start:datetime, date_end:datetime, conn_str=None):
+    def select_counts_in_time(self, table: str, items, count_name, time_name, date_start:datetime, date_end:datetime, conn_str=None, statement_timeout=None):
         sql = self._select_items_condition_sql(
             table, f'count({table}.{items})')
         sql.insert(2,f"as {count_name}")
         sql += [Method.WHERE, time_name, Method.BETWEEN, f"'{date_start}'", Method.AND, f"'{date_end}'"]
-        return self._execute(self._to_sql_string(sql), fetchall=True, conn_str=conn_str)
+        return self._execute(self._to_sql_string(sql), fetchall=True, conn_str=conn_str, statement_timeout=statement_timeout, idempotent=True)
 
-    def insert_item(self, table, items, values):
+    def insert_item(self, table, items, values, statement_timeout=None):
         sql = self._insert_item_sql(table, items, values)
-        self._execute(self._to_sql_string(sql))
+        self._execute(self._to_sql_string(sql), statement_timeout=statement_timeout)
 
-    def update_item(self, table: str, update_item: list, update_value: list, conditions: dict = None):
-        self._update_item(table, update_item, update_value, conditions)
+    def update_item(self, table: str, update_item: list, update_value: list, conditions: dict = None, statement_timeout=None):
+        self._update_item(table, update_item, update_value, conditions, statement_timeout=statement_timeout)
         return
 
-    def delete_item(self, table: str, conditions: dict):
-        return self._delete_item_condition(table, conditions)
+    def delete_item(self, table: str, conditions: dict, statement_timeout=None):
+        return self._delete_item_condition(table, conditions, statement_timeout=statement_timeout)
 
     def create_index(self, index_name, table_name, column_names: Union[str, list, tuple], unlock=True, base: BaseMethod = BaseMethod.CREATE):
         sql = [base, Method.INDEX]
@@ -247,3 +385,153 @@ class Database:
         if isinstance(column_names, list) or isinstance(column_names, tuple):
             sql.append(f"({','.join(column_names)})")
         return sql
+
+    def _watch_channel(self, table: str) -> str:
+        # LISTEN takes an unquoted identifier which PostgreSQL lowercases and cuts to 63 bytes,
+        # pg_notify takes the name as written, so both sides must already use the folded name
+        channel = f"pyesql_watch_{table.replace('.', '_')}".lower()
+        return channel.encode()[:63].decode(errors="ignore")
+
+    def install_watch_trigger(self, table: str) -> str:
+        channel = self._watch_channel(table)
+        self._execute(f"CREATE OR REPLACE FUNCTION {channel}() RETURNS trigger AS $$ "
+                      f"BEGIN PERFORM pg_notify('{channel}', TG_TABLE_NAME); RETURN NULL; END; "
+                      "$$ LANGUAGE plpgsql;")
+        self._execute(f"DROP TRIGGER IF EXISTS {channel} ON {table};")
+        self._execute(f"CREATE TRIGGER {channel} AFTER INSERT OR UPDATE ON {table} "
+                      f"FOR EACH STATEMENT EXECUTE PROCEDURE {channel}();")
+        return channel
+
+    def drop_watch_trigger(self, table: str) -> None:
+        channel = self._watch_channel(table)
+        self._execute(f"DROP TRIGGER IF EXISTS {channel} ON {table};")
+        self._execute(f"DROP FUNCTION IF EXISTS {channel}();")
+
+    def _listen(self, channel: str):
+        # Goes through the breaker like any other call so a failover does not cause a LISTEN reconnect storm
+        self._connect_timeout()
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_call()
+        conn = None
+        try:
+            conn = self._connect()
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {channel};")
+        except (ConnectionError, OperationalError) as e:
+            if conn is not None:
+                conn.close()
+            self._record_call_result(success=not is_transient(e))
+            raise
+        except Exception:
+            # The server answered, e.g. with a ProgrammingError for the channel
+            if conn is not None:
+                conn.close()
+            self._record_call_result(success=True)
+            raise
+        except BaseException:
+            if conn is not None:
+                conn.close()
+            self._release_trial()
+            raise
+        self._record_call_result(success=True)
+        return conn
+
+    def _wait_notify(self, conn, timeout: float) -> None:
+        # Notifications only wake the watcher, the payload is not needed since a range query follows
+        if psycopg.__name__ == "psycopg2":
+            if select.select([conn], [], [], timeout)[0]:
+                conn.poll()
+                conn.notifies.clear()
+        else:
+            for _ in conn.notifies(timeout=timeout, stop_after=1):
+                pass
+            for _ in conn.notifies(timeout=0):
+                pass
+
+    def _watch_batch(self, table: str, watermark_column: str, items: Union[str, list, tuple], lower, batch_size: int = None,
+                     statement_timeout=None, upper=None):
+        if isinstance(items, list) or isinstance(items, tuple):
+            items = ','.join(items)
+        conditions = []
+        if lower is not None:
+            conditions += [watermark_column, ">", f"'{lower}'"]
+        if upper is not None:
+            if conditions:
+                conditions.append(Method.AND)
+            conditions += [watermark_column, "<=", f"'{upper}'"]
+        # The watermark column is selected first so the next batch can start after the last row
+        sql = self._select_items_condition_sql(table, f"{watermark_column},{items}",
+                                               [Method.WHERE] + conditions if conditions else None)
+        sql.extend([Method.ORDER, Method.BY, watermark_column, Order.ASC])
+        if batch_size:
+            sql.extend([Method.LIMIT, f"{batch_size}"])
+        # Polling queries are not profiled, they would be sampled and explained on every round
+        return self._execute(self._to_sql_string(sql), fetchall=True, statement_timeout=statement_timeout, idempotent=True,
+                             profile=False)
+
+    def watch(self, table: str, watermark_column: str, items: Union[str, list, tuple] = '*', watermark=None,
+              checkpoint: Checkpoint = None, batch_size: int = 500, poll_interval: float = 1.0,
+              listen: bool = False, stop_when_idle: bool = False, statement_timeout=None, lag=None):
+        # 'watermark_column' must be unique and increasing (e.g. a serial id) and should be indexed so
+        # every batch is a range scan. Concurrent writers can commit out of order: once id 11 has been
+        # read, an id 10 committed later is behind the watermark and is never returned. 'lag' (an int
+        # for ids, a timedelta for timestamps) re-reads that trailing window on every round and yields
+        # late rows it has not seen yet, rows committed later than 'lag' behind the newest row are still
+        # missed. With 'listen' the triggers from install_watch_trigger wake the watcher, and
+        # 'poll_interval' bounds the wait and is the polling period while the listener is down.
+        seen = set()
+        if watermark is None and checkpoint is not None:
+            watermark = checkpoint.load()
+            seen = set(checkpoint.load_seen())
+        if isinstance(lag, timedelta) and isinstance(watermark, str):
+            watermark = datetime.fromisoformat(watermark)
+        channel = self._watch_channel(table)
+        listener = None
+        try:
+            while True:
+                if listen and listener is None:
+                    try:
+                        listener = self._listen(channel)
+                    except (ConnectionError, OperationalError) as e:
+                        if not is_transient(e):
+                            raise
+                window = None
+                try:
+                    if lag and watermark is not None:
+                        window = self._watch_batch(table, watermark_column, items, watermark - lag,
+                                                   statement_timeout=statement_timeout, upper=watermark)
+                    batch = self._watch_batch(table, watermark_column, items, watermark, batch_size, statement_timeout)
+                except (ConnectionError, OperationalError) as e:
+                    if not is_transient(e):
+                        raise
+                    # Keep polling through outages and an open breaker, which bounds the load on the server
+                    time.sleep(poll_interval)
+                    continue
+                rows = []
+                if window is not None:
+                    rows += [row for row in window if str(row[0]) not in seen]
+                    seen = {str(row[0]) for row in window}
+                rows += batch
+                for row in rows:
+                    yield row[1:]
+                if batch:
+                    watermark = batch[-1][0]
+                if lag:
+                    seen.update(str(row[0]) for row in batch)
+                if rows and checkpoint is not None:
+                    checkpoint.save(watermark, seen if lag else None)
+                if len(batch) < batch_size:
+                    if stop_when_idle:
+                        return
+                    if listener is not None:
+                        try:
+                            self._wait_notify(listener, poll_interval)
+                            continue
+                        except (OperationalError, OSError):
+                            self._record_call_result(success=False)
+                            listener.close()
+                            listener = None
+                    time.sleep(poll_interval)
+        finally:
+            if listener is not None:
+                listener.close()
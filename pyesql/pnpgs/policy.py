@@ -0,0 +1,98 @@
+import random
+import threading
+import time
+
+from .enums import ConnectionError
+
+# Connection exceptions (class 08) and operator intervention shutdowns (57P0x) go away once the server is back
+CONNECTION_EXCEPTION_CLASS = "08"
+OPERATOR_INTERVENTION_PREFIX = "57P0"
+# libpq reports these connect failures without a SQLSTATE, retrying them only repeats the same answer
+PERMANENT_CONNECT_MESSAGES = ("authentication failed", "does not exist", "no password supplied",
+                              "permission denied")
+
+
+def error_sqlstate(error: Exception):
+    # psycopg exposes the SQLSTATE as 'sqlstate', psycopg2 as 'pgcode'
+    return getattr(error, "sqlstate", None) or getattr(error, "pgcode", None)
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, ConnectionError):
+        # Only transient connect failures are wrapped in ConnectionError
+        return True
+    sqlstate = error_sqlstate(error)
+    if sqlstate is None:
+        message = str(error).lower()
+        return not any(permanent in message for permanent in PERMANENT_CONNECT_MESSAGES)
+    return sqlstate.startswith(CONNECTION_EXCEPTION_CLASS) or sqlstate.startswith(OPERATOR_INTERVENTION_PREFIX)
+
+
+class RetryPolicy:
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.1, max_delay: float = 2.0) -> None:
+        if max_attempts < 1:
+            raise ValueError(f"'max_attempts' must be at least 1, but got {max_attempts}")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        # Full jitter keeps workers that failed together from reconnecting together
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    raise ConnectionError(f"Circuit breaker is open, retry in {remaining:.1f}s")
+                self._state = self.HALF_OPEN
+                self._trial_running = False
+            # Half open lets a single trial call through to probe the server
+            if self._trial_running:
+                raise ConnectionError("Circuit breaker is half open, trial call in progress")
+            self._trial_running = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def release_trial(self) -> None:
+        # The call ended without an answer from the server, leave the state alone but free the trial slot
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
@@ -0,0 +1,59 @@
+import json
+from typing import List
+
+SEQ_SCAN_NODE = "Seq Scan"
+
+
+class PlanNode:
+    node_type: str
+    relation: str
+    rows: float
+    actual_time: float
+    children: List["PlanNode"]
+
+    def __init__(self, node_type: str, relation: str = None, rows: float = None, actual_time: float = None,
+                 filter: str = None, index_name: str = None, children: List["PlanNode"] = None) -> None:
+        self.node_type = node_type
+        self.relation = relation
+        self.rows = rows
+        self.actual_time = actual_time
+        self.filter = filter
+        self.index_name = index_name
+        self.children = children if children else []
+
+    @classmethod
+    def from_explain(cls, plan: dict):
+        return cls(node_type=plan.get("Node Type"),
+                   relation=plan.get("Relation Name"),
+                   rows=plan.get("Actual Rows", plan.get("Plan Rows")),
+                   actual_time=plan.get("Actual Total Time"),
+                   filter=plan.get("Filter"),
+                   index_name=plan.get("Index Name"),
+                   children=[cls.from_explain(child) for child in plan.get("Plans", [])])
+
+    @property
+    def is_full_scan(self) -> bool:
+        return self.node_type == SEQ_SCAN_NODE
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self) -> dict:
+        return {"node_type": self.node_type,
+                "relation": self.relation,
+                "rows": self.rows,
+                "actual_time": self.actual_time,
+                "filter": self.filter,
+                "index_name": self.index_name,
+                "children": [child.to_dict() for child in self.children]}
+
+
+def parse_explain(rows: list) -> PlanNode:
+    # EXPLAIN (FORMAT JSON) returns a single row holding a one element list
+    document = rows[0][0]
+    if isinstance(document, str):
+        document = json.loads(document)
+    return PlanNode.from_explain(document[0]["Plan"])
+
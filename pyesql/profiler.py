@@ -0,0 +1,138 @@
+import json
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Union
+
+_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_COMMA_PATTERN = re.compile(r"\s*,\s*")
+_VALUES_PATTERN = re.compile(r"(\(\?(?:,\?)*\))(?:,\1)+")
+_CONDITION_PATTERN = re.compile(
+    r"([A-Za-z_][\w\.]*)\s*(?:=|<>|!=|<=|>=|<|>|\bBETWEEN\b|\bLIKE\b|\bIN\b)", re.IGNORECASE)
+_WHERE_PATTERN = re.compile(
+    r"\bWHERE\b(.*?)(?:\bORDER\b|\bGROUP\b|\bLIMIT\b|;|$)", re.IGNORECASE | re.DOTALL)
+_FROM_PATTERN = re.compile(r"\bFROM\s+\"?([A-Za-z_][\w\.]*)\"?", re.IGNORECASE)
+_ALIAS_PATTERN = re.compile(
+    r"\b(?:FROM|JOIN)\s+\"?([A-Za-z_][\w\.]*)\"?(?:\s+(?:AS\s+)?\"?([A-Za-z_]\w*)\"?)?", re.IGNORECASE)
+_ALIAS_KEYWORDS = ("WHERE", "ORDER", "GROUP", "LIMIT", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS",
+                   "NATURAL", "ON", "USING", "HAVING", "UNION", "WINDOW")
+
+
+def query_shape(sql: str) -> str:
+    shape = _COMMA_PATTERN.sub(",", _LITERAL_PATTERN.sub("?", sql))
+    shape = _VALUES_PATTERN.sub(r"\1,...", shape)
+    return " ".join(shape.split())
+
+
+def condition_columns(sql: str) -> List[str]:
+    where = _WHERE_PATTERN.search(_LITERAL_PATTERN.sub("?", sql))
+    if not where:
+        return []
+    columns = []
+    for column in _CONDITION_PATTERN.findall(where.group(1)):
+        column = column.split(".")[-1]
+        if column.upper() not in ("AND", "OR", "NOT") and column not in columns:
+            columns.append(column)
+    return columns
+
+
+def source_table(sql: str) -> Union[str, None]:
+    match = _FROM_PATTERN.search(sql)
+    return match.group(1) if match else None
+
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    aliases = {}
+    for table, alias in _ALIAS_PATTERN.findall(sql):
+        if alias and alias.upper() not in _ALIAS_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+class QueryProfiler:
+    def __init__(self, sample_rate: float = 0.0, threshold: float = None, large_table_rows: int = 10000,
+                 explain_analyze: bool = True, profile_interval: float = 60.0) -> None:
+        # 'explain_analyze' makes PostgreSQL execute a profiled statement a second time to
+        # report actual rows and timings, disable it to only fetch the estimated plan.
+        # Each query shape is explained at most once per 'profile_interval' seconds.
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.large_table_rows = large_table_rows
+        self.explain_analyze = explain_analyze
+        self.profile_interval = profile_interval
+        self._lock = threading.Lock()
+        self._shapes: Dict[str, dict] = {}
+        self._last_profiled: Dict[str, float] = {}
+
+    def should_profile(self, sql: str, elapsed: float) -> bool:
+        if not sql.lstrip().upper().startswith("SELECT"):
+            return False
+        selected = self.threshold is not None and elapsed >= self.threshold
+        if not selected and not (self.sample_rate > 0 and random.random() < self.sample_rate):
+            return False
+        shape = query_shape(sql)
+        now = time.monotonic()
+        with self._lock:
+            # Claim the shape so concurrent slow calls do not all pay for an EXPLAIN
+            last_profiled = self._last_profiled.get(shape)
+            if last_profiled is not None and now - last_profiled < self.profile_interval:
+                return False
+            self._last_profiled[shape] = now
+        return True
+
+    def _shape_entry(self, shape: str) -> dict:
+        if shape not in self._shapes:
+            self._shapes[shape] = {"calls": 0, "profiled": 0, "errors": 0, "last_error": None,
+                                   "total_time": 0.0, "max_time": 0.0, "findings": {}, "plan": None}
+        return self._shapes[shape]
+
+    def record_call(self, sql: str, elapsed: float) -> None:
+        with self._lock:
+            entry = self._shape_entry(query_shape(sql))
+            entry["calls"] += 1
+            entry["total_time"] += elapsed
+            entry["max_time"] = max(entry["max_time"], elapsed)
+
+    def record_error(self, sql: str, error: Exception) -> None:
+        with self._lock:
+            entry = self._shape_entry(query_shape(sql))
+            entry["errors"] += 1
+            entry["last_error"] = f"{type(error).__name__}: {error}"
+
+    def analyze(self, plan, columns: List[str], table_rows: Dict[str, float],
+                indexed_columns: List[str]) -> List[str]:
+        findings = []
+        for node in plan.walk():
+            if node.is_full_scan and node.relation:
+                rows = table_rows.get(node.relation)
+                if rows is not None and rows >= self.large_table_rows:
+                    findings.append(f"sequential scan on large table {node.relation} ({int(rows)} rows)")
+        for column in columns:
+            if column not in indexed_columns:
+                findings.append(f"missing index on condition column {column}")
+        return findings
+
+    def record_plan(self, sql: str, plan, findings: List[str]) -> None:
+        with self._lock:
+            entry = self._shape_entry(query_shape(sql))
+            entry["profiled"] += 1
+            entry["plan"] = plan.to_dict()
+            for finding in findings:
+                entry["findings"][finding] = entry["findings"].get(finding, 0) + 1
+
+    def report(self) -> Dict[str, dict]:
+        with self._lock:
+            return json.loads(json.dumps(self._shapes))
+
+    def dump(self, file_path: str = None) -> str:
+        data = json.dumps(self.report(), indent=2)
+        if file_path:
+            with open(file_path, 'w') as fp:
+                fp.write(data)
+        return data
+
+    def reset(self) -> None:
+        with self._lock:
+            self._shapes = {}
+            self._last_profiled = {}
@@ -0,0 +1,32 @@
+import json
+import os
+from typing import List
+
+
+class Checkpoint:
+    file_path: str
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+
+    def _load_state(self) -> dict:
+        if not os.path.exists(self.file_path):
+            return {}
+        with open(self.file_path, 'r') as fp:
+            return json.load(fp)
+
+    def load(self):
+        return self._load_state().get("watermark")
+
+    def load_seen(self) -> List[str]:
+        return self._load_state().get("seen", [])
+
+    def save(self, watermark, seen: List[str] = None) -> None:
+        state = {"watermark": watermark}
+        if seen:
+            state["seen"] = sorted(seen)
+        # Write then rename so a crash never leaves a truncated checkpoint behind
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, 'w') as fp:
+            json.dump(state, fp, default=str)
+        os.replace(tmp_path, self.file_path)
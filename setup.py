@@ -2,7 +2,7 @@ import setuptools
 from setuptools import setup
 
 dependencies = [
-    "psycopg[binary] ; platform_system!='Windows'",
+    "psycopg[binary]>=3.2 ; platform_system!='Windows'",
     "psycopg2 ; platform_system!='Windows'",
     "psycopg2-binary ; platform_system=='Windows'"
 ]
@@ -0,0 +1,206 @@
+import pytest
+
+from pyesql.pnpgs import database, policy
+from pyesql.pnpgs.database import Database, OperationalError
+from pyesql.pnpgs.enums import ConnectionError
+from pyesql.pnpgs.policy import CircuitBreaker, RetryPolicy, is_transient
+from pyesql.profiler import QueryProfiler
+
+
+def operational_error(message="boom", sqlstate=None):
+    error_class = type("FakeOperationalError", (OperationalError,), {"sqlstate": sqlstate, "pgcode": sqlstate})
+    return error_class(message)
+
+
+class FakeCursor:
+    def __init__(self, error=None, *results):
+        self.error = error
+        self.results = list(results)
+
+    def execute(self, sql):
+        if self.error is not None:
+            raise self.error
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.closed = False
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connects(monkeypatch):
+    # Each queued item is either an exception raised by connect or a FakeCursor served by the connection
+    queue, calls = [], []
+
+    def connect(conninfo, **kwargs):
+        calls.append(kwargs)
+        item = queue.pop(0)
+        if isinstance(item, BaseException):
+            raise item
+        return FakeConnection(item)
+    monkeypatch.setattr(database.psycopg, "connect", connect)
+    monkeypatch.setattr(policy.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(database.time, "sleep", lambda seconds: None)
+    return queue, calls
+
+
+def make_database(**kwargs):
+    return Database(create_db_if_notexists=False, **kwargs)
+
+
+def test_retry_delay_is_jittered_and_capped(monkeypatch):
+    retry = RetryPolicy(max_attempts=5, base_delay=0.1, max_delay=0.3)
+    monkeypatch.setattr(policy.random, "uniform", lambda low, high: high)
+    assert [retry.delay(attempt) for attempt in range(4)] == [0.1, 0.2, 0.3, 0.3]
+    monkeypatch.setattr(policy.random, "uniform", lambda low, high: low)
+    assert retry.delay(3) == 0
+    with pytest.raises(ValueError):
+        RetryPolicy(max_attempts=0)
+
+
+def test_circuit_breaker_state_machine(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(policy.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(ConnectionError):
+        breaker.before_call()
+
+    now[0] = 11.0
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(ConnectionError):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] = 22.0
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_is_transient():
+    assert is_transient(ConnectionError("down"))
+    assert is_transient(operational_error("server closed the connection unexpectedly"))
+    assert is_transient(operational_error(sqlstate="08006"))
+    assert is_transient(operational_error(sqlstate="57P01"))
+    assert not is_transient(operational_error(sqlstate="57014"))
+    assert not is_transient(operational_error(sqlstate="28P01"))
+    assert not is_transient(operational_error(sqlstate="3D000"))
+    assert not is_transient(operational_error('password authentication failed for user "a"'))
+    assert not is_transient(operational_error('database "a" does not exist'))
+
+
+def test_reads_retry_transient_errors(connects):
+    queue, calls = connects
+    queue += [operational_error("refused"), FakeCursor(error=operational_error(sqlstate="57P01")),
+              FakeCursor(None, [(1,)])]
+    db = make_database(retry_policy=RetryPolicy(max_attempts=3))
+    assert db.select_items("t", "id") == [(1,)]
+    assert len(calls) == 3
+
+
+def test_writes_only_retry_failed_connects(connects):
+    queue, calls = connects
+    queue += [operational_error("refused"), FakeCursor(error=operational_error(sqlstate="08006"))]
+    db = make_database(retry_policy=RetryPolicy(max_attempts=3))
+    with pytest.raises(OperationalError):
+        db.insert_item("t", ["id"], ["1"])
+    assert len(calls) == 2
+
+
+def test_permanent_connect_errors_are_not_wrapped_or_retried(connects):
+    queue, calls = connects
+    breaker = CircuitBreaker(failure_threshold=1)
+    queue += [operational_error(sqlstate="28P01")]
+    db = make_database(retry_policy=RetryPolicy(max_attempts=3), circuit_breaker=breaker)
+    with pytest.raises(OperationalError) as error:
+        db.select_items("t", "id")
+    assert error.value.sqlstate == "28P01"
+    assert len(calls) == 1 and breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_tripped_mid_retry_reports_real_error(connects):
+    queue, calls = connects
+    refused = operational_error("connection refused")
+    queue += [refused, refused, refused]
+    breaker = CircuitBreaker(failure_threshold=2)
+    db = make_database(retry_policy=RetryPolicy(max_attempts=3), circuit_breaker=breaker)
+    with pytest.raises(ConnectionError) as error:
+        db.select_items("t", "id")
+    assert error.value.__cause__ is refused
+    assert len(calls) == 2 and breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(ConnectionError, match="Circuit breaker is open"):
+        db.select_items("t", "id")
+
+
+def test_timeouts_reach_the_connection(connects):
+    queue, calls = connects
+    plan = [{"Plan": {"Node Type": "Seq Scan", "Relation Name": "t"}}]
+    queue += [FakeCursor(None, [(1,)]), FakeCursor(None, [[plan]], [("t", 20000.0, None)])]
+    profiler = QueryProfiler(sample_rate=1.0)
+    db = make_database(connect_timeout=5, profiler=profiler)
+    db.select_items("t", "id", statement_timeout=0.5)
+    assert calls[0] == {"connect_timeout": 5, "options": "-c statement_timeout=500"}
+    # The EXPLAIN re-execution is bound by the same per call statement timeout
+    assert calls[1] == calls[0]
+    entry = profiler.report()["SELECT id FROM t;"]
+    assert entry["profiled"] == 1 and entry["errors"] == 0
+    assert entry["findings"] == {"sequential scan on large table t (20000 rows)": 1}
+
+
+def test_connect_timeout_must_be_whole_seconds(connects):
+    db = make_database(connect_timeout=0.5)
+    with pytest.raises(ValueError):
+        db.select_items("t", "id")
+
+
+def test_interrupted_trial_call_releases_the_breaker(connects, monkeypatch):
+    queue, calls = connects
+    now = [0.0]
+    monkeypatch.setattr(policy.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    now[0] = 11.0
+    queue += [KeyboardInterrupt(), FakeCursor(None, [(1,)])]
+    db = make_database(circuit_breaker=breaker)
+    with pytest.raises(KeyboardInterrupt):
+        db.select_items("t", "id")
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert db.select_items("t", "id") == [(1,)]
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_invalid_arguments_do_not_close_the_breaker(connects, monkeypatch):
+    queue, calls = connects
+    now = [0.0]
+    monkeypatch.setattr(policy.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    now[0] = 11.0
+    db = make_database(connect_timeout=0.5, circuit_breaker=breaker)
+    with pytest.raises(ValueError):
+        db.select_items("t", "id")
+    assert breaker.state == CircuitBreaker.OPEN and calls == []
@@ -0,0 +1,133 @@
+import json
+
+from pyesql.pnlite3.database import Database as SQLite3Database
+from pyesql.pnlite3.profiler import parse_explain as parse_sqlite3_explain
+from pyesql.pnpgs.database import Database as PostgreDatabase
+from pyesql.pnpgs.profiler import parse_explain as parse_postgre_explain
+from pyesql import profiler as profiler_module
+from pyesql.profiler import QueryProfiler, condition_columns, query_shape, source_table, table_aliases
+
+
+def test_query_shape_replaces_literals_and_collapses_values():
+    assert query_shape("SELECT id FROM t WHERE name='a' AND id=3;") == "SELECT id FROM t WHERE name=? AND id=?;"
+    assert query_shape("INSERT INTO t (a,b) VALUES ('1','2'),('3', '4');") == "INSERT INTO t (a,b) VALUES (?,?),...;"
+
+
+def test_condition_columns():
+    assert condition_columns("SELECT * FROM t WHERE name='a' AND t.id=3 ORDER BY id;") == ["name", "id"]
+    assert condition_columns("SELECT count(t.id) as c FROM t WHERE ts BETWEEN '1' AND '2';") == ["ts"]
+    assert condition_columns("SELECT * FROM t;") == []
+
+
+def test_source_table_accepts_quoted_names():
+    assert source_table('SELECT * FROM "events" WHERE id=1;') == "events"
+    assert source_table("SELECT * FROM public.events;") == "public.events"
+    assert source_table("SELECT 1;") is None
+
+
+def test_parse_postgre_explain():
+    document = [{"Plan": {"Node Type": "Aggregate", "Plans": [
+        {"Node Type": "Seq Scan", "Relation Name": "t", "Actual Rows": 5, "Filter": "(id = 1)"}]}}]
+    for rows in ([[document]], [[json.dumps(document)]]):
+        plan = parse_postgre_explain(rows)
+        assert plan.node_type == "Aggregate" and not plan.is_full_scan
+        scan = plan.children[0]
+        assert scan.is_full_scan and scan.relation == "t" and scan.rows == 5
+
+
+def test_parse_sqlite3_explain():
+    plan = parse_sqlite3_explain([(2, 0, 0, "SCAN t"),
+                                  (5, 0, 0, "SEARCH u USING INDEX u_idx (a=?)"),
+                                  (7, 5, 0, "SCAN v USING COVERING INDEX v_idx")])
+    scan, search = plan.children
+    assert scan.is_full_scan and scan.relation == "t"
+    assert not search.is_full_scan and search.relation == "u" and search.index_name == "u_idx"
+    assert not search.children[0].is_full_scan and search.children[0].relation == "v"
+
+
+def test_analyze_flags_large_scans_and_missing_indexes():
+    profiler = QueryProfiler(large_table_rows=10)
+    plan = parse_sqlite3_explain([(2, 0, 0, "SCAN t")])
+    assert profiler.analyze(plan, ["name", "id"], {"t": 20}, ["id"]) == [
+        "sequential scan on large table t (20 rows)", "missing index on condition column name"]
+    assert profiler.analyze(plan, [], {"t": 5}, []) == []
+    assert profiler.analyze(plan, [], {}, []) == []
+
+
+def _sqlite3_database(tmp_path, profiler):
+    db = SQLite3Database(str(tmp_path / "profile.db"), profiler=profiler)
+    db.create_table("t", ["id", "name"], ["integer", "text"], ["PRIMARY KEY", ""])
+    db.insert_item("t", ["name"], [[f"n{i}"] for i in range(20)])
+    return db
+
+
+def test_sqlite3_profiling_uses_stat1_estimates(tmp_path):
+    profiler = QueryProfiler(sample_rate=1.0, large_table_rows=10, profile_interval=0)
+    db = _sqlite3_database(tmp_path, profiler)
+    db.select_items("t", ["id"], {"name": "n1"})
+    entry = profiler.report()["SELECT id FROM t WHERE name=?;"]
+    assert entry["findings"] == {"missing index on condition column name": 1}
+
+    db.custom_SQL("ANALYZE;", fetchall=False)
+    db.select_items("t", ["id"], {"name": "n1"})
+    db.select_items("t", ["id"], {"id": 1})
+    report = profiler.report()
+    assert report["SELECT id FROM t WHERE name=?;"]["findings"] == {
+        "missing index on condition column name": 2, "sequential scan on large table t (20 rows)": 1}
+    assert report["SELECT id FROM t WHERE id=?;"]["findings"] == {}
+
+
+def test_sqlite3_profiling_errors_are_recorded(tmp_path, monkeypatch):
+    profiler = QueryProfiler(sample_rate=1.0)
+    db = _sqlite3_database(tmp_path, profiler)
+
+    def fail(sql):
+        raise KeyError("plan")
+    monkeypatch.setattr(db, "_explain", fail)
+    assert len(db.select_items("t", ["id"])) == 20
+    entry = profiler.report()["SELECT id FROM t;"]
+    assert entry["errors"] == 1 and entry["last_error"] == "KeyError: 'plan'"
+
+
+def test_postgre_profiling_never_raises(monkeypatch):
+    profiler = QueryProfiler(sample_rate=1.0)
+    db = PostgreDatabase(create_db_if_notexists=False, profiler=profiler)
+
+    def fail(*args, **kwargs):
+        raise IndexError("list index out of range")
+    monkeypatch.setattr(db, "_connect", fail)
+    db._profile("SELECT * FROM t;", 0.1)
+    assert profiler.report()["SELECT * FROM t;"]["errors"] == 1
+
+
+def test_table_aliases():
+    assert table_aliases("SELECT x.id FROM t AS x JOIN u y ON x.id = y.id WHERE x.id=1;") == {"x": "t", "y": "u"}
+    assert table_aliases("SELECT id FROM t WHERE id=1;") == {}
+
+
+def test_sqlite3_profiling_maps_aliases_to_tables(tmp_path):
+    profiler = QueryProfiler(sample_rate=1.0, large_table_rows=10)
+    db = _sqlite3_database(tmp_path, profiler)
+    db.custom_SQL("ANALYZE;", fetchall=False)
+    db.custom_SQL("SELECT x.id FROM t AS x WHERE x.name='n1';")
+    assert profiler.report()["SELECT x.id FROM t AS x WHERE x.name=?;"]["findings"] == {
+        "sequential scan on large table x (20 rows)": 1, "missing index on condition column name": 1}
+
+
+def test_profiling_cooldown_per_shape(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(profiler_module.time, "monotonic", lambda: now[0])
+    profiler = QueryProfiler(threshold=0.5, profile_interval=60)
+    assert profiler.should_profile("SELECT * FROM t WHERE id=1;", 1.0)
+    assert not profiler.should_profile("SELECT * FROM t WHERE id=2;", 1.0)
+    assert profiler.should_profile("SELECT * FROM u;", 1.0)
+    assert not profiler.should_profile("SELECT * FROM u;", 0.1)
+    now[0] = 61.0
+    assert profiler.should_profile("SELECT * FROM t WHERE id=3;", 1.0)
+
+
+def test_sqlite3_watch_polls_are_not_profiled(tmp_path):
+    profiler = QueryProfiler(sample_rate=1.0)
+    db = _sqlite3_database(tmp_path, profiler)
+    assert len(list(db.watch("t", "id", ["name"], stop_when_idle=True))) == 20
+    assert not [shape for shape in profiler.report() if "ORDER BY id ASC" in shape]
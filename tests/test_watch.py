@@ -0,0 +1,177 @@
+import sqlite3
+
+import pytest
+
+from pyesql.pnlite3.database import Database as SQLite3Database
+from pyesql.pnpgs import database, policy
+from pyesql.pnpgs.database import Database as PostgreDatabase, OperationalError
+from pyesql.pnpgs.enums import ConnectionError
+from pyesql.pnpgs.policy import CircuitBreaker
+from pyesql.watch import Checkpoint
+
+
+@pytest.fixture
+def sqlite3_database(tmp_path):
+    db = SQLite3Database(str(tmp_path / "watch.db"))
+    db.create_table("t", ["id", "name"], ["integer", "text"], ["PRIMARY KEY", ""])
+    return db
+
+
+def test_checkpoint_round_trip(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    assert checkpoint.load() is None and checkpoint.load_seen() == []
+    checkpoint.save(7, {"6", "7"})
+    assert checkpoint.load() == 7 and checkpoint.load_seen() == ["6", "7"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["checkpoint.json"]
+
+
+def test_sqlite3_watch_resumes_from_checkpoint(sqlite3_database, tmp_path):
+    db = sqlite3_database
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    db.insert_item("t", ["name"], [[f"n{i}"] for i in range(7)])
+    rows = list(db.watch("t", "id", ["name"], checkpoint=checkpoint, batch_size=3, stop_when_idle=True))
+    assert rows == [(f"n{i}",) for i in range(7)]
+    assert checkpoint.load() == 7
+
+    db.insert_item("t", ["name"], [["x"], ["y"]])
+    rows = list(db.watch("t", "id", checkpoint=checkpoint, batch_size=3, stop_when_idle=True))
+    assert rows == [(8, "x"), (9, "y")]
+
+
+def test_sqlite3_watch_raises_on_sql_errors(sqlite3_database):
+    with pytest.raises(sqlite3.Error):
+        list(sqlite3_database.watch("t", "missing_column", stop_when_idle=True))
+
+
+class SQLite3Cursor:
+    def __init__(self, conn):
+        self.cursor = conn.cursor()
+
+    def execute(self, sql):
+        if not sql.startswith("LISTEN"):
+            self.cursor.execute(sql)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def close(self):
+        pass
+
+
+class SQLite3Connection:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self):
+        return SQLite3Cursor(self.conn)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def postgre_database(monkeypatch):
+    # The generated range queries are plain SQL, an in memory SQLite table stands in for the server
+    # behind psycopg.connect so '_execute' and the circuit breaker still run
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (id integer PRIMARY KEY, name text)")
+    connects = []
+
+    def connect(conninfo, **kwargs):
+        connects.append(conninfo)
+        return SQLite3Connection(conn)
+    monkeypatch.setattr(database.psycopg, "connect", connect)
+    db = PostgreDatabase(create_db_if_notexists=False)
+    return db, conn, connects
+
+
+def test_postgre_watch_lag_yields_late_commits_once(postgre_database, tmp_path):
+    db, conn, connects = postgre_database
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [(1, "a"), (2, "b"), (4, "d")])
+    assert list(db.watch("t", "id", ["name"], checkpoint=checkpoint, lag=5, stop_when_idle=True)) == [
+        ("a",), ("b",), ("d",)]
+
+    # id 3 commits after id 4 was read
+    conn.execute("INSERT INTO t VALUES (3, 'c')")
+    assert list(db.watch("t", "id", ["name"], stop_when_idle=True, watermark=4)) == []
+    assert list(db.watch("t", "id", ["name"], checkpoint=checkpoint, lag=5, stop_when_idle=True)) == [("c",)]
+    assert list(db.watch("t", "id", ["name"], checkpoint=checkpoint, lag=5, stop_when_idle=True)) == []
+
+
+class FakeListener:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_postgre_watch_survives_listener_failures(postgre_database, monkeypatch):
+    db, conn, connects = postgre_database
+    listeners = []
+
+    def listen(channel):
+        if not listeners:
+            listeners.append(None)
+            raise ConnectionError("Unable to connect to database")
+        listeners.append(FakeListener())
+        return listeners[-1]
+
+    def wait_notify(listener, timeout):
+        raise OperationalError("server closed the connection unexpectedly")
+    monkeypatch.setattr(db, "_listen", listen)
+    monkeypatch.setattr(db, "_wait_notify", wait_notify)
+    monkeypatch.setattr(database.time, "sleep",
+                        lambda seconds: conn.execute("INSERT INTO t (name) VALUES ('row')"))
+
+    rows = db.watch("t", "id", ["id"], listen=True)
+    # The first LISTEN fails, the watcher polls and picks up the row
+    assert next(rows) == (1,)
+    # The listener drops while waiting, it is closed, the watcher polls and reconnects
+    assert next(rows) == (2,)
+    assert listeners[1].closed and len(listeners) == 3
+    rows.close()
+    assert listeners[2].closed
+
+
+def test_postgre_watch_polls_through_open_breaker(postgre_database, monkeypatch):
+    db, conn, connects = postgre_database
+    now = [0.0]
+    monkeypatch.setattr(policy.time, "monotonic", lambda: now[0])
+    db.circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    db.circuit_breaker.record_failure()
+    sleeps = []
+
+    def sleep(seconds):
+        # Neither LISTEN nor the polling query may reach the server while the breaker is open
+        assert connects == []
+        sleeps.append(seconds)
+        now[0] += 11.0
+        conn.execute("INSERT INTO t (name) VALUES ('row')")
+    monkeypatch.setattr(database.time, "sleep", sleep)
+
+    rows = db.watch("t", "id", ["id"], listen=True, poll_interval=0.25)
+    assert next(rows) == (1,)
+    assert sleeps == [0.25]
+    assert db.circuit_breaker.state == CircuitBreaker.CLOSED
+    rows.close()
+
+
+def test_postgre_watch_raises_on_permanent_errors(postgre_database, monkeypatch):
+    db, conn, connects = postgre_database
+
+    def connect(conninfo, **kwargs):
+        raise OperationalError('password authentication failed for user "a"')
+    monkeypatch.setattr(database.psycopg, "connect", connect)
+    monkeypatch.setattr(database.time, "sleep", lambda seconds: pytest.fail("permanent errors must not be polled"))
+    with pytest.raises(OperationalError, match="authentication failed"):
+        next(db.watch("t", "id"))
+
+
+def test_postgre_watch_channel_matches_unquoted_listen():
+    db = PostgreDatabase(create_db_if_notexists=False)
+    assert db._watch_channel("public.Orders") == "pyesql_watch_public_orders"
+    assert len(db._watch_channel("t" * 100).encode()) == 63